@@ -3,21 +3,125 @@
 Academic Reference Formatter - Main Flask Application
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
+import orjson
 import os
 import io
+import re
+import html
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
+from docx import Document
+from docx.shared import Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
 from modules.parser import ReferenceParser
 from modules.api_client import APIClient
 from modules.formatter import ReferenceFormatter
 from config import config
 
+# 可用格式（固定不變，載入時計算一次）
+AVAILABLE_STYLES = tuple(ReferenceFormatter.get_available_styles())
+_FORMAT = ReferenceFormatter.format
+
+# 匯出檔案中顯示的格式名稱
+STYLE_NAMES = {
+    'apa': 'APA 7th Edition',
+    'mla': 'MLA 9th Edition',
+    'chicago': 'Chicago Manual of Style 17th Edition',
+    'harvard': 'Harvard Referencing Style'
+}
+
+# BibTeX 匯出欄位：(文獻資料欄位, BibTeX 欄位)
+_BIBTEX_FIELDS = (
+    ('title', 'title'),
+    ('authors', 'author'),
+    ('year', 'year'),
+    ('journal', 'journal'),
+    ('volume', 'volume'),
+    ('issue', 'number'),
+    ('pages', 'pages'),
+    ('doi', 'doi'),
+    ('url', 'url'),
+)
+
+# 斜體標記（*text*），匯出 HTML 時轉換為 <em>text</em>
+_ITALIC_RE = re.compile(r'\*([^*]+)\*')
+
+# 匯出 HTML 的頁首模板（{style} 為格式名稱）
+_HTML_HEAD_TMPL = """
+<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>參考文獻 - {style}</title>
+    <style>
+        body {{
+            font-family: "Times New Roman", Times, serif;
+            max-width: 800px;
+            margin: 40px auto;
+            padding: 20px;
+            line-height: 1.6;
+        }}
+        h1 {{
+            text-align: center;
+            font-size: 24px;
+            margin-bottom: 10px;
+        }}
+        .style-info {{
+            text-align: center;
+            color: #666;
+            margin-bottom: 30px;
+        }}
+        .reference {{
+            margin-bottom: 1em;
+            padding-left: 2em;
+            text-indent: -2em;
+        }}
+        @media print {{
+            body {{
+                margin: 0;
+                padding: 1in;
+            }}
+        }}
+    </style>
+</head>
+<body>
+    <h1>參考文獻 / References</h1>
+    <p class="style-info">格式：{style}</p>
+"""
+
+_HTML_FOOT = """
+</body>
+</html>
+"""
+
+
+class ORJSONProvider(JSONProvider):
+    """使用 orjson（C 實作）處理 JSON 序列化，加速大型 /parse 回應"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # 創建應用實例
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # 載入配置
 env = os.environ.get('FLASK_ENV', 'development')
 app.config.from_object(config[env])
 
+# 啟用回應壓縮（Brotli 優先，其次 gzip）
+Compress(app)
+
 # 生產環境安全檢查
 if env == 'production':
     if not app.config.get('SECRET_KEY') or app.config['SECRET_KEY'] == 'dev-secret-key-please-change-in-production':
@@ -25,7 +129,127 @@ if env == 'production':
 
 # 初始化模組
 parser = ReferenceParser()
-api_client = APIClient()
+api_client = APIClient(pool_maxsize=app.config['ENRICH_MAX_WORKERS'])
+
+
+def _enrich(parsed_data, prefetched=None):
+    """
+    使用 API 補完單條文獻（供執行緒池並行呼叫）
+
+    Args:
+        parsed_data: 解析後的文獻資料
+        prefetched: 批次 DOI 查詢結果
+
+    Returns:
+        (文獻資料, 狀態) 元組
+    """
+    if not (parsed_data.doi or parsed_data.title):
+        return parsed_data, 'complete'
+
+    try:
+        enriched_data = api_client.enrich_reference(parsed_data, prefetched)
+        if enriched_data.enriched:
+            return enriched_data, 'enriched'
+    except Exception as e:
+        print(f"API 查詢失敗: {e}")
+
+    return parsed_data, 'complete'
+
+
+def _format_styles(parsed_data, styles):
+    """
+    將單條文獻格式化為指定的多種格式
+
+    Returns:
+        格式 -> 格式化字串；失敗時為錯誤訊息
+    """
+    formatted_refs = {}
+    for style in styles:
+        try:
+            formatted_refs[style] = _FORMAT(parsed_data, style)
+        except Exception as e:
+            formatted_refs[style] = f"[格式化失敗: {str(e)}]"
+    return formatted_refs
+
+
+def _join_chunks(separator, chunks):
+    """逐一產生 chunks，並在相鄰 chunk 之間插入分隔符（串流版的 str.join）"""
+    for i, chunk in enumerate(chunks):
+        if i:
+            yield separator
+        yield chunk
+
+
+def _stream_download(chunks, mimetype, filename):
+    """
+    以串流回應下載檔案
+
+    內容邊產生邊送出，不需先組合完整字串再放入 BytesIO
+    """
+    response = Response(chunks, mimetype=mimetype)
+    try:
+        filename.encode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    except UnicodeEncodeError:
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+def _validate_export(references, format_type):
+    """
+    檢查匯出資料的結構
+
+    串流回應的內容在端點返回後才產生，屆時的錯誤無法再轉為 400 回應，
+    因此先檢查生成器會用到的欄位型別，不符時拋出 ValueError
+    """
+    if not isinstance(references, list):
+        raise ValueError('references 必須是列表')
+
+    for i, ref in enumerate(references):
+        if not isinstance(ref, dict):
+            raise ValueError(f'第 {i + 1} 條文獻必須是物件')
+
+        if format_type == 'bibtex':
+            ref_data = ref.get('data', {})
+            if not isinstance(ref_data, dict):
+                raise ValueError(f'第 {i + 1} 條文獻的 data 必須是物件')
+            authors = ref_data.get('authors')
+            if authors and not (isinstance(authors, list)
+                                and all(isinstance(a, dict) for a in authors)):
+                raise ValueError(f'第 {i + 1} 條文獻的 authors 必須是物件列表')
+        elif not isinstance(ref.get('formatted', ''), str):
+            raise ValueError(f'第 {i + 1} 條文獻的 formatted 必須是字串')
+
+
+def _bibtex_entry(index, ref):
+    """生成單條 BibTeX 條目"""
+    ref_data = ref.get('data', {})
+    entry_type = 'article' if ref_data.get('type') == 'article' else 'misc'
+
+    # 構建 BibTeX 條目（依 _BIBTEX_FIELDS 順序輸出有值的欄位）
+    entry_lines = [f"@{entry_type}{{ref{index + 1},"]
+    for key, bib_key in _BIBTEX_FIELDS:
+        value = ref_data.get(key)
+        if value:
+            if key == 'authors':
+                value = ' and '.join(f"{a.get('last', '')}, {a.get('first', '')}" for a in value)
+            entry_lines.append(f"  {bib_key} = {{{value}}},")
+
+    entry_lines.append("}")
+    return '\n'.join(entry_lines)
+
+
+def _html_chunks(references, style_name):
+    """逐段產生 HTML 匯出內容"""
+    # 格式名稱可能來自請求參數，同樣需要轉義
+    yield _HTML_HEAD_TMPL.format(style=html.escape(style_name))
+    for ref in references:
+        # 轉義 HTML 特殊字元，再處理斜體標記（*text* -> <em>text</em>）
+        formatted = html.escape(ref.get('formatted', ''), quote=False)
+        formatted = _ITALIC_RE.sub(r'<em>\1</em>', formatted)
+
+        yield f'    <div class="reference">{formatted}</div>\n'
+    yield _HTML_FOOT
 
 @app.route('/')
 def index():
@@ -52,60 +276,107 @@ def parse_references():
         raw_text = data.get('text', '')
         format_style = data.get('format', 'apa')  # 默認使用 APA 格式
         enrich = data.get('enrich', True)  # 是否使用 API 補完資料
+        include_all = data.get('include_all_formats', False)  # 是否返回所有格式的版本
+
+        # 不支援的格式退回 APA
+        if format_style not in AVAILABLE_STYLES:
+            format_style = 'apa'
+        styles = AVAILABLE_STYLES if include_all else (format_style,)
 
         # 將文獻文字按行分割（每行一條文獻）
         lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
 
-        # 解析和格式化文獻
+        # 重複的文獻只處理一次：unique 記錄不重複的行，positions[i] 為第 i 行對應的 unique 索引
+        unique = {}
+        positions = [unique.setdefault(line, len(unique)) for line in lines]
+
+        # 1. 解析文獻
+        parse = parser.parse_reference
+        parsed_list = [parse(line) for line in unique]
+
+        # 2. 如果需要，使用 API 補完資料（I/O 密集，以執行緒池並行查詢，map 保持輸入順序）
+        if enrich and parsed_list:
+            # 先以批次請求查詢所有 DOI，無 DOI 或未找到的文獻再個別以標題查詢
+            prefetched = api_client.query_by_dois(
+                [parsed_data.doi for parsed_data in parsed_list if parsed_data.doi]
+            )
+            max_workers = min(app.config['ENRICH_MAX_WORKERS'], len(parsed_list))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                enriched_list = list(executor.map(partial(_enrich, prefetched=prefetched), parsed_list))
+        else:
+            enriched_list = [(parsed_data, 'complete') for parsed_data in parsed_list]
+
+        # 3. 格式化（只在 include_all_formats 時生成所有格式，其餘格式可透過 /reformat 取得）
+        formatted_list = [_format_styles(parsed_data, styles) for parsed_data, _ in enriched_list]
+
         results = []
-        for i, line in enumerate(lines):
-            # 1. 解析文獻
-            parsed_data = parser.parse_reference(line)
-
-            # 2. 如果需要，使用 API 補完資料
-            if enrich and (parsed_data.get('doi') or parsed_data.get('title')):
-                try:
-                    enriched_data = api_client.enrich_reference(parsed_data)
-                    if enriched_data.get('enriched'):
-                        parsed_data = enriched_data
-                        status = 'enriched'
-                    else:
-                        status = 'complete'
-                except Exception as e:
-                    print(f"API 查詢失敗: {e}")
-                    status = 'complete'
-            else:
-                status = 'complete'
-
-            # 3. 格式化為所有格式（用於前端切換）
-            formatted_refs = {}
-            for style in ReferenceFormatter.get_available_styles():
-                try:
-                    formatted_refs[style] = ReferenceFormatter.format(parsed_data, style)
-                except Exception as e:
-                    formatted_refs[style] = f"[格式化失敗: {str(e)}]"
+        for i, (line, pos) in enumerate(zip(lines, positions)):
+            parsed_data, status = enriched_list[pos]
+            formatted_refs = formatted_list[pos]
 
             # 4. 組合結果
-            results.append({
+            result = {
                 'id': i,
                 'original': line,
                 'status': status,
-                'formatted': formatted_refs.get(format_style, formatted_refs['apa']),
-                'formatted_all': formatted_refs,  # 所有格式的版本
-                'data': parsed_data,
-                'completeness': parsed_data.get('completeness', 0.0),
-                'confidence': parsed_data.get('confidence', 0.0)
-            })
+                'formatted': formatted_refs[format_style],
+                'data': parsed_data,  # ParsedReference，由 JSON provider 直接序列化為物件
+                'completeness': parsed_data.completeness,
+                'confidence': parsed_data.confidence
+            }
+            if include_all:
+                result['formatted_all'] = formatted_refs  # 所有格式的版本
+            results.append(result)
 
         return jsonify({
             'success': True,
             'count': len(results),
             'references': results,
-            'available_formats': ReferenceFormatter.get_available_styles()
+            'available_formats': list(AVAILABLE_STYLES)
+        })
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/reformat', methods=['POST'])
+def reformat_references():
+    """
+    重新格式化端點
+    接收已解析的文獻資料，返回指定格式的結果（前端切換格式時使用）
+    """
+    try:
+        data = request.get_json()
+        references = data.get('references', [])
+        format_style = data.get('format', 'apa')
+
+        if format_style not in AVAILABLE_STYLES:
+            return jsonify({
+                'success': False,
+                'error': f'不支援的格式: {format_style}'
+            }), 400
+
+        if not isinstance(references, list) or not all(isinstance(ref, dict) for ref in references):
+            return jsonify({
+                'success': False,
+                'error': 'references 必須是物件列表'
+            }), 400
+
+        formatted = [
+            _format_styles(ref_data, (format_style,))[format_style]
+            for ref_data in references
+        ]
+
+        return jsonify({
+            'success': True,
+            'format': format_style,
+            'formatted': formatted
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({
             'success': False,
@@ -123,33 +394,23 @@ def export_references(format_type):
         references = data.get('references', [])
         citation_style = data.get('style', 'apa')
 
+        if format_type in ('txt', 'bibtex', 'html'):
+            _validate_export(references, format_type)
+
         if format_type == 'txt':
-            content = '\n\n'.join([ref.get('formatted', '') for ref in references])
-            buffer = io.BytesIO(content.encode('utf-8'))
-            buffer.seek(0)
-            return send_file(
-                buffer,
+            return _stream_download(
+                _join_chunks('\n\n', (ref.get('formatted', '') for ref in references)),
                 mimetype='text/plain',
-                as_attachment=True,
-                download_name=f'references_{citation_style}.txt'
+                filename=f'references_{citation_style}.txt'
             )
 
         elif format_type == 'docx':
-            from docx import Document
-            from docx.shared import Pt
-            from docx.enum.text import WD_ALIGN_PARAGRAPH
-
             doc = Document()
             doc.add_heading('參考文獻 / References', 0)
 
             # 添加格式資訊
-            style_names = {
-                'apa': 'APA 7th Edition',
-                'mla': 'MLA 9th Edition',
-                'chicago': 'Chicago Manual of Style 17th Edition',
-                'harvard': 'Harvard Referencing Style'
-            }
-            style_para = doc.add_paragraph(f'格式：{style_names.get(citation_style, citation_style.upper())}')
+            style_name = STYLE_NAMES.get(citation_style, citation_style.upper())
+            style_para = doc.add_paragraph(f'格式：{style_name}')
             style_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
             doc.add_paragraph()  # 空行
@@ -174,125 +435,21 @@ def export_references(format_type):
 
         elif format_type == 'bibtex':
             # 生成 BibTeX 格式
-            bibtex_entries = []
-            for i, ref in enumerate(references):
-                ref_data = ref.get('data', {})
-                entry_type = 'article' if ref_data.get('type') == 'article' else 'misc'
-                cite_key = f"ref{i+1}"
-
-                # 構建 BibTeX 條目
-                entry_lines = [f"@{entry_type}{{{cite_key},"]
-
-                if ref_data.get('title'):
-                    entry_lines.append(f"  title = {{{ref_data['title']}}},")
-                if ref_data.get('authors'):
-                    authors_str = ' and '.join([
-                        f"{a.get('last', '')}, {a.get('first', '')}"
-                        for a in ref_data['authors']
-                    ])
-                    entry_lines.append(f"  author = {{{authors_str}}},")
-                if ref_data.get('year'):
-                    entry_lines.append(f"  year = {{{ref_data['year']}}},")
-                if ref_data.get('journal'):
-                    entry_lines.append(f"  journal = {{{ref_data['journal']}}},")
-                if ref_data.get('volume'):
-                    entry_lines.append(f"  volume = {{{ref_data['volume']}}},")
-                if ref_data.get('issue'):
-                    entry_lines.append(f"  number = {{{ref_data['issue']}}},")
-                if ref_data.get('pages'):
-                    entry_lines.append(f"  pages = {{{ref_data['pages']}}},")
-                if ref_data.get('doi'):
-                    entry_lines.append(f"  doi = {{{ref_data['doi']}}},")
-                if ref_data.get('url'):
-                    entry_lines.append(f"  url = {{{ref_data['url']}}},")
-
-                entry_lines.append("}")
-                bibtex_entries.append('\n'.join(entry_lines))
-
-            content = '\n\n'.join(bibtex_entries)
-            buffer = io.BytesIO(content.encode('utf-8'))
-            buffer.seek(0)
-
-            return send_file(
-                buffer,
+            return _stream_download(
+                _join_chunks('\n\n', (_bibtex_entry(i, ref) for i, ref in enumerate(references))),
                 mimetype='text/plain',
-                as_attachment=True,
-                download_name='references.bib'
+                filename='references.bib'
             )
 
         elif format_type == 'html':
             # 生成 HTML 格式
-            style_names = {
-                'apa': 'APA 7th Edition',
-                'mla': 'MLA 9th Edition',
-                'chicago': 'Chicago Manual of Style 17th Edition',
-                'harvard': 'Harvard Referencing Style'
-            }
-
-            html_content = f"""
-<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>參考文獻 - {style_names.get(citation_style, citation_style.upper())}</title>
-    <style>
-        body {{
-            font-family: "Times New Roman", Times, serif;
-            max-width: 800px;
-            margin: 40px auto;
-            padding: 20px;
-            line-height: 1.6;
-        }}
-        h1 {{
-            text-align: center;
-            font-size: 24px;
-            margin-bottom: 10px;
-        }}
-        .style-info {{
-            text-align: center;
-            color: #666;
-            margin-bottom: 30px;
-        }}
-        .reference {{
-            margin-bottom: 1em;
-            padding-left: 2em;
-            text-indent: -2em;
-        }}
-        @media print {{
-            body {{
-                margin: 0;
-                padding: 1in;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <h1>參考文獻 / References</h1>
-    <p class="style-info">格式：{style_names.get(citation_style, citation_style.upper())}</p>
-"""
-            for ref in references:
-                formatted = ref.get('formatted', '')
-                # 處理斜體標記（*text* -> <em>text</em>）
-                formatted = formatted.replace('*', '<em>', 1).replace('*', '</em>', 1)
-                while '*' in formatted:
-                    formatted = formatted.replace('*', '<em>', 1)
-                    if '*' in formatted:
-                        formatted = formatted.replace('*', '</em>', 1)
-
-                html_content += f'    <div class="reference">{formatted}</div>\n'
-
-            html_content += """
-</body>
-</html>
-"""
-            return html_content
+            style_name = STYLE_NAMES.get(citation_style, citation_style.upper())
+            return Response(_html_chunks(references, style_name), mimetype='text/html')
 
         else:
             return jsonify({'error': '不支援的格式'}), 400
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 400
 
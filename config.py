@@ -28,12 +28,26 @@ class Config:
 
     # API 配置
     CROSSREF_EMAIL = os.environ.get('CROSSREF_EMAIL', 'support@example.com')
+    ENRICH_MAX_WORKERS = int(os.environ.get('ENRICH_MAX_WORKERS', 16))  # 並行 API 查詢執行緒數
 
     # 速率限制
     RATELIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
     RATELIMIT_DEFAULT = "100/hour"
     RATELIMIT_STORAGE_URL = "memory://"
 
+    # 回應壓縮（Flask-Compress），/parse 的 JSON 壓縮後可大幅縮短傳輸時間
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIN_SIZE = 512
+    # 匯出檔案（TXT/BibTeX/HTML 皆為串流回應）刻意不壓縮：Flask-Compress 1.14 壓縮串流時
+    # 會先以 get_data() 讀入完整內容，串流匯出的固定記憶體用量將失效
+    COMPRESS_STREAMS = False
+    COMPRESS_MIMETYPES = [
+        'application/json',
+        'text/html',  # 頁面（匯出的 HTML 為串流，不受影響）
+        'text/css',
+        'application/javascript',
+    ]
+
     # 日誌
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 
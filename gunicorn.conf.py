@@ -3,23 +3,33 @@ Gunicorn 配置文件
 生產環境 WSGI 伺服器設定
 """
 
+# preload_app 會在 master 進程載入應用，必須在 requests/ssl 被匯入前完成 gevent 的 monkey patch
+from gevent import monkey
+monkey.patch_all()
+
 import multiprocessing
 
 # 綁定地址
 bind = "0.0.0.0:8080"
 
-# Worker 進程數（建議：CPU 核心數 * 2 + 1）
-workers = multiprocessing.cpu_count() * 2 + 1
+# Worker 進程數（gevent worker 可並行處理請求，CPU 核心數 + 1 即可）
+workers = multiprocessing.cpu_count() + 1
 
 # Worker 類型（sync 適合 CPU 密集，gevent 適合 I/O 密集）
-worker_class = "sync"
+# /parse 主要時間花在等待 CrossRef 回應，使用 gevent 讓單一 worker 在網路等待時切換處理其他請求
+# 經 monkey patch 後，requests 的 socket 操作在等待時會讓出執行權
+worker_class = "gevent"
 
-# 每個 worker 的線程數
-threads = 2
+# 每個 worker 同時處理的最大連接數
+worker_connections = 1000
 
 # Worker 超時時間（秒）
 timeout = 120
 
+# 在 master 進程預先載入應用，fork 後各 worker 以 copy-on-write 共享已匯入的模組
+# （Flask、python-docx、requests 等只匯入一次，降低每個 worker 的記憶體用量並加快重啟）
+preload_app = True
+
 # 最大請求數（防止記憶體洩漏）
 max_requests = 1000
 max_requests_jitter = 50
@@ -34,3 +44,14 @@ keepalive = 5
 
 # 優雅重啟
 graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    """
+    Worker fork 後的初始化
+
+    APIClient 的 requests.Session 在 master 載入應用時建立；master 不發送請求，
+    連接池應為空，但仍在每個 worker 中清空，確保不會與其他進程共用 socket
+    """
+    from app import api_client
+    api_client.session.close()
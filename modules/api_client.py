@@ -8,15 +8,27 @@ API Client Module
 - 整合多個 API 來源
 """
 
+import copy
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+from functools import lru_cache
+from cachetools import LRUCache, TTLCache
+from dataclasses import replace
 from typing import Dict, Optional, List
 import logging
 
+from modules.parser import ParsedReference
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class _NoResult(Exception):
+    """查詢沒有結果（以例外傳遞，避免 lru_cache 快取失敗結果）"""
+
+
 class APIClient:
     """文獻 API 客戶端"""
 
@@ -24,25 +36,64 @@ class APIClient:
     OPENALEX_API = "https://api.openalex.org/works"
     DOI_ORG = "https://doi.org"
 
+    # 合併 API 資料時處理的欄位（_parse_crossref_response 的輸出欄位）
+    _SCALAR_FIELDS = ('title', 'year', 'journal', 'volume', 'issue', 'pages', 'doi', 'publisher', 'type')
+    _LIST_FIELDS = ('authors',)
+
+    # 批次 DOI 查詢時每個請求包含的 DOI 數
+    DOI_BATCH_SIZE = 20
+
     # 請求標頭（禮貌性標識）
     HEADERS = {
         'User-Agent': 'AcademicReferenceFormatter/1.0 (mailto:support@example.com)'
     }
 
-    def __init__(self, timeout: int = 10, max_retries: int = 3):
+    def __init__(self, timeout: int = 10, max_retries: int = 3, pool_maxsize: int = 16,
+                 cache_size: int = 4096, negative_cache_ttl: int = 3600):
         """
         初始化 API 客戶端
 
         Args:
             timeout: 請求超時時間（秒）
             max_retries: 最大重試次數
+            pool_maxsize: 每個主機保留的最大連接數（應與並行查詢數一致）
+            cache_size: 查詢結果快取的最大條目數
+            negative_cache_ttl: 404 結果的快取時間（秒）
         """
         self.timeout = timeout
         self.max_retries = max_retries
 
+        # 查詢結果快取：相同 DOI / 標題不再重複發送網路請求，只快取成功結果
+        # DOI 快取（正規化 DOI -> 元數據）由個別查詢與批次查詢共用，以鎖保護
+        self._doi_cache = LRUCache(maxsize=cache_size)
+        self._doi_cache_lock = threading.Lock()
+        # 標題查詢失敗時以 _NoResult 例外跳出，避免 lru_cache 快取失敗結果
+        self._cached_metadata_query = lru_cache(maxsize=cache_size)(self._fetch_by_metadata)
+
+        # 404 負面快取：已確認不存在的 URL 在 TTL 內不再重新請求
+        # TTLCache 非執行緒安全，以鎖保護（/parse 會並行查詢）
+        self._neg_cache = TTLCache(maxsize=2048, ttl=negative_cache_ttl)
+        self._neg_cache_lock = threading.Lock()
+
+        # 重試策略：速率限制（429）與伺服器錯誤以指數退避重試，並遵守 Retry-After 標頭
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False  # 重試用盡後返回最後的回應，由 _make_request 處理
+        )
+
+        # 持久 Session：重用 TCP/TLS 連接（keep-alive），避免每次查詢重新握手
+        self.session = requests.Session()
+        self.session.headers.update(self.HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('https://', adapter)
+
     def query_by_doi(self, doi: str) -> Optional[Dict]:
         """
-        通過 DOI 查詢 CrossRef
+        通過 DOI 查詢 CrossRef（結果會被快取）
 
         Args:
             doi: DOI 識別碼
@@ -53,20 +104,38 @@ class APIClient:
         if not doi:
             return None
 
-        url = f"{self.CROSSREF_API}/{doi}"
+        # DOI 不分大小寫，正規化後作為快取鍵
+        doi = doi.strip().lower()
+
+        cached = self._get_cached_doi(doi)
+        if cached is not None:
+            return cached
 
         try:
-            response = self._make_request(url)
-            if response and response.get('status') == 'ok':
-                return self._parse_crossref_response(response['message'])
+            record = self._fetch_by_doi(doi)
+        except _NoResult:
+            return None
         except Exception as e:
             logger.error(f"CrossRef 查詢失敗 (DOI: {doi}): {e}")
+            return None
 
-        return None
+        self._put_cached_doi(doi, record)
+        return copy.deepcopy(record)
+
+    def _get_cached_doi(self, doi: str) -> Optional[Dict]:
+        """從 DOI 快取取出結果的副本（doi 須已正規化），未命中返回 None"""
+        with self._doi_cache_lock:
+            record = self._doi_cache.get(doi)
+        return copy.deepcopy(record) if record is not None else None
+
+    def _put_cached_doi(self, doi: str, record: Dict):
+        """將查詢結果存入 DOI 快取（doi 須已正規化）"""
+        with self._doi_cache_lock:
+            self._doi_cache[doi] = record
 
     def query_by_metadata(self, title: str, authors: List[str] = None) -> Optional[Dict]:
         """
-        通過標題和作者模糊查詢
+        通過標題和作者模糊查詢（結果會被快取）
 
         Args:
             title: 文章標題
@@ -78,63 +147,150 @@ class APIClient:
         if not title:
             return None
 
+        # 只用前兩個作者查詢，快取鍵也只取前兩個
+        key_authors = tuple(authors[:2]) if authors else ()
+
+        try:
+            return copy.deepcopy(self._cached_metadata_query(title.strip().lower(), key_authors))
+        except _NoResult:
+            pass
+        except Exception as e:
+            logger.error(f"標題查詢失敗: {e}")
+
+        return None
+
+    def query_by_dois(self, dois: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        批次通過 DOI 查詢 CrossRef
+
+        已快取的 DOI 直接使用快取結果，其餘以 filter=doi:X,doi:Y,... 在單一請求中
+        查詢多個 DOI（M 個未命中的 DOI 只需 ⌈M / DOI_BATCH_SIZE⌉ 次請求），
+        查到的結果存入與 query_by_doi 共用的快取
+
+        Args:
+            dois: DOI 列表
+
+        Returns:
+            正規化（小寫）DOI -> 文獻元數據字典；查詢過但不存在的 DOI 對應 None，
+            未能批次查詢的 DOI（請求失敗或含逗號）不會出現在結果中
+        """
+        # 去重並正規化；含逗號的 DOI 會破壞 filter 語法，留給個別查詢
+        unique = list(dict.fromkeys(
+            doi.strip().lower() for doi in dois if doi and ',' not in doi
+        ))
+
+        results = {}
+        misses = []
+        for doi in unique:
+            cached = self._get_cached_doi(doi)
+            if cached is not None:
+                results[doi] = cached
+            else:
+                misses.append(doi)
+
+        # 只剩單一未命中的 DOI 時直接走個別查詢
+        if len(misses) < 2:
+            return results
+
+        for start in range(0, len(misses), self.DOI_BATCH_SIZE):
+            batch = misses[start:start + self.DOI_BATCH_SIZE]
+            doi_filter = ','.join(f'doi:{doi}' for doi in batch)
+            url = f"{self.CROSSREF_API}?filter={doi_filter}&rows={len(batch)}"
+
+            try:
+                response = self._make_request(url)
+                if not response or response.get('status') != 'ok':
+                    continue
+
+                found = {}
+                for item in response['message'].get('items', []):
+                    record = self._parse_crossref_response(item)
+                    if record.get('doi'):
+                        found[record['doi'].lower()] = record
+
+                for doi in batch:
+                    record = found.get(doi)
+                    if record is not None:
+                        self._put_cached_doi(doi, record)
+                        record = copy.deepcopy(record)
+                    results[doi] = record
+            except Exception as e:
+                logger.error(f"CrossRef 批次查詢失敗: {e}")
+
+        return results
+
+    def _fetch_by_doi(self, doi: str) -> Dict:
+        """發送 DOI 查詢並解析回應，沒有結果時拋出 _NoResult"""
+        url = f"{self.CROSSREF_API}/{doi}"
+
+        response = self._make_request(url)
+        if response and response.get('status') == 'ok':
+            return self._parse_crossref_response(response['message'])
+
+        raise _NoResult(doi)
+
+    def _fetch_by_metadata(self, title: str, authors: tuple) -> Dict:
+        """發送標題/作者查詢並解析回應，沒有結果時拋出 _NoResult"""
         # 構建查詢參數
         query_parts = [f'title:"{title}"']
         if authors:
-            author_query = ' '.join(authors[:2])  # 只用前兩個作者
+            author_query = ' '.join(authors)
             query_parts.append(f'author:"{author_query}"')
 
         query = ' '.join(query_parts)
         url = f"{self.CROSSREF_API}?query={query}&rows=1"
 
-        try:
-            response = self._make_request(url)
-            if response and response.get('status') == 'ok':
-                items = response['message'].get('items', [])
-                if items:
-                    return self._parse_crossref_response(items[0])
-        except Exception as e:
-            logger.error(f"標題查詢失敗: {e}")
+        response = self._make_request(url)
+        if response and response.get('status') == 'ok':
+            items = response['message'].get('items', [])
+            if items:
+                return self._parse_crossref_response(items[0])
 
-        return None
+        raise _NoResult(title)
 
-    def enrich_reference(self, partial_data: Dict) -> Dict:
+    def enrich_reference(self, partial_data: ParsedReference,
+                         prefetched: Optional[Dict[str, Optional[Dict]]] = None) -> ParsedReference:
         """
         補完不完整的文獻資料
 
         Args:
             partial_data: 部分解析的文獻資料
+            prefetched: query_by_dois 的批次查詢結果（可選）
 
         Returns:
-            補完後的文獻資料
+            補完後的文獻資料（新物件，不修改 partial_data）
         """
-        enriched = partial_data.copy()
         api_data = None
 
-        # 優先使用 DOI 查詢
-        if partial_data.get('doi'):
-            logger.info(f"使用 DOI 查詢: {partial_data['doi']}")
-            api_data = self.query_by_doi(partial_data['doi'])
+        # 優先使用 DOI 查詢（已批次查詢過的 DOI 直接使用結果）
+        if partial_data.doi:
+            doi_key = partial_data.doi.strip().lower()
+            if prefetched and doi_key in prefetched:
+                api_data = prefetched[doi_key]
+            else:
+                logger.info(f"使用 DOI 查詢: {partial_data.doi}")
+                api_data = self.query_by_doi(partial_data.doi)
 
         # 如果 DOI 查詢失敗，嘗試標題查詢
-        if not api_data and partial_data.get('title'):
-            logger.info(f"使用標題查詢: {partial_data['title'][:50]}...")
-            authors = [a.get('last', '') for a in partial_data.get('authors', [])]
-            api_data = self.query_by_metadata(partial_data['title'], authors)
+        if not api_data and partial_data.title:
+            logger.info(f"使用標題查詢: {partial_data.title[:50]}...")
+            authors = [a.get('last', '') for a in partial_data.authors]
+            api_data = self.query_by_metadata(partial_data.title, authors)
 
         # 合併 API 資料
         if api_data:
             enriched = self._merge_data(partial_data, api_data)
-            enriched['enriched'] = True
-            enriched['enrichment_source'] = 'crossref'
+            enriched.enriched = True
+            enriched.enrichment_source = 'crossref'
         else:
-            enriched['enriched'] = False
+            enriched = partial_data.copy()
+            enriched.enriched = False
 
         return enriched
 
     def _make_request(self, url: str) -> Optional[Dict]:
         """
-        發送 HTTP 請求（含重試機制）
+        發送 HTTP 請求（重試機制由 Session 的 HTTPAdapter 提供）
 
         Args:
             url: 請求 URL
@@ -142,32 +298,28 @@ class APIClient:
         Returns:
             JSON 回應，失敗返回 None
         """
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.get(
-                    url,
-                    headers=self.HEADERS,
-                    timeout=self.timeout
-                )
-
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code == 404:
-                    logger.warning(f"資源不存在 (404): {url}")
-                    return None
-                elif response.status_code == 429:
-                    # 速率限制，等待後重試
-                    wait_time = 2 ** attempt
-                    logger.warning(f"速率限制，等待 {wait_time} 秒後重試...")
-                    time.sleep(wait_time)
-                else:
-                    logger.warning(f"HTTP {response.status_code}: {url}")
-
-            except requests.Timeout:
-                logger.warning(f"請求超時 (嘗試 {attempt + 1}/{self.max_retries})")
-            except Exception as e:
-                logger.error(f"請求失敗: {e}")
-                break
+        with self._neg_cache_lock:
+            if url in self._neg_cache:
+                return None
+
+        # 重試由 HTTPAdapter 的 Retry 策略處理
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.Timeout:
+            logger.warning(f"請求超時: {url}")
+            return None
+        except Exception as e:
+            logger.error(f"請求失敗: {e}")
+            return None
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            logger.warning(f"資源不存在 (404): {url}")
+            with self._neg_cache_lock:
+                self._neg_cache[url] = True
+        else:
+            logger.warning(f"HTTP {response.status_code}: {url}")
 
         return None
 
@@ -250,7 +402,7 @@ class APIClient:
 
         return result
 
-    def _merge_data(self, original: Dict, api_data: Dict) -> Dict:
+    def _merge_data(self, original: ParsedReference, api_data: Dict) -> ParsedReference:
         """
         合併原始資料和 API 資料
 
@@ -263,15 +415,19 @@ class APIClient:
         Returns:
             合併後的資料
         """
-        merged = original.copy()
-
-        # 對於每個欄位，如果 API 資料有值且原始資料沒有或不完整，使用 API 資料
-        for key, value in api_data.items():
-            if value:  # API 資料有值
-                if not merged.get(key):  # 原始資料沒有
-                    merged[key] = value
-                elif isinstance(value, list) and len(value) > len(merged.get(key, [])):
-                    # 列表類型且 API 資料更完整
-                    merged[key] = value
-
-        return merged
+        updates = {}
+
+        # 單值欄位：API 資料有值且原始資料沒有時使用 API 資料
+        for key in self._SCALAR_FIELDS:
+            value = api_data.get(key)
+            if value and not getattr(original, key):
+                updates[key] = value
+
+        # 列表欄位：API 資料更完整時使用 API 資料
+        for key in self._LIST_FIELDS:
+            value = api_data.get(key)
+            if value and len(value) > len(getattr(original, key) or ()):
+                updates[key] = value
+
+        # 一次複製並套用所有變更
+        return replace(original, **updates)
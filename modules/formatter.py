@@ -11,11 +11,18 @@ Reference Formatter Module
 
 from typing import Dict, List, Optional
 from abc import ABC, abstractmethod
+from types import MappingProxyType
 
 
 class BaseFormatter(ABC):
     """文獻格式化器基類"""
 
+    # 格式化器不帶狀態，只保留類型分派表；每層類別都宣告 __slots__ 以免產生 __dict__
+    __slots__ = ('_dispatch',)
+
+    # 作者格式選項（子類別覆寫）：傳給 _format_authors 的關鍵字參數
+    AUTHOR_OPTIONS: Dict = {}
+
     @abstractmethod
     def format_article(self, data: Dict) -> str:
         """格式化期刊文章"""
@@ -31,6 +38,14 @@ class BaseFormatter(ABC):
         """格式化網站"""
         pass
 
+    def __init__(self):
+        # 文獻類型 -> 格式化方法
+        self._dispatch = {
+            'article': self.format_article,
+            'book': self.format_book,
+            'website': self.format_website,
+        }
+
     def format(self, data: Dict) -> str:
         """
         根據文獻類型自動選擇格式化方法
@@ -41,17 +56,8 @@ class BaseFormatter(ABC):
         Returns:
             格式化後的文獻字串
         """
-        ref_type = data.get('type', 'unknown')
-
-        if ref_type == 'article':
-            return self.format_article(data)
-        elif ref_type == 'book':
-            return self.format_book(data)
-        elif ref_type == 'website':
-            return self.format_website(data)
-        else:
-            # 未知類型，嘗試作為文章格式化
-            return self.format_article(data)
+        # 未知類型，嘗試作為文章格式化
+        return self._dispatch.get(data.get('type', 'unknown'), self.format_article)(data)
 
     def _format_authors(self, authors: List[Dict], max_authors: int = None,
                        last_first: bool = True, ampersand: bool = False,
@@ -73,35 +79,33 @@ class BaseFormatter(ABC):
             return ""
 
         # 限制作者數量
-        if max_authors and len(authors) > max_authors:
+        use_et_al = bool(max_authors) and len(authors) > max_authors
+        if use_et_al:
             authors = authors[:max_authors]
-            use_et_al = True
+
+        # 第一個作者：last_first 時倒置為「姓, 名」
+        last = authors[0].get('last', '')
+        first = authors[0].get('first', '')
+        if last_first:
+            formatted = [f"{last}, {first}." if first else last]
         else:
-            use_et_al = False
+            formatted = [f"{first}. {last}" if first else last]
 
-        formatted = []
-        for i, author in enumerate(authors):
+        # 其餘作者：invert_all 且 last_first 時也倒置（迴圈外決定）
+        tail_invert = invert_all and last_first
+        for author in authors[1:]:
             last = author.get('last', '')
             first = author.get('first', '')
-
-            # 第一個作者或所有作者都倒置
-            if (i == 0 and last_first) or (invert_all and last_first):
-                if first:
-                    formatted.append(f"{last}, {first}.")
-                else:
-                    formatted.append(last)
+            if tail_invert:
+                formatted.append(f"{last}, {first}." if first else last)
             else:
-                if first:
-                    formatted.append(f"{first}. {last}")
-                else:
-                    formatted.append(last)
+                formatted.append(f"{first}. {last}" if first else last)
 
         # 組合作者
         if len(formatted) == 1:
             result = formatted[0]
         elif len(formatted) == 2:
-            connector = " & " if ampersand else " and "
-            result = connector.join(formatted)
+            result = (" & " if ampersand else " and ").join(formatted)
         else:
             connector = ", & " if ampersand else ", and "
             result = ", ".join(formatted[:-1]) + connector + formatted[-1]
@@ -115,60 +119,61 @@ class BaseFormatter(ABC):
 class APAFormatter(BaseFormatter):
     """APA 7th Edition 格式化器"""
 
+    __slots__ = ()
+
+    # 作者格式選項（傳給 _format_authors，各文獻類型共用）
+    AUTHOR_OPTIONS = {'last_first': True, 'ampersand': True, 'invert_all': True}
+
     def format_article(self, data: Dict) -> str:
         """
         格式化期刊文章
         格式：Author, A. A. (Year). Title of article. Title of Periodical, volume(issue), pages. https://doi.org/xxx
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            max_authors=20,
-            last_first=True,
-            ampersand=True,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, max_authors=20, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"({year}).")
 
         # 標題（不使用斜體，因為是純文字）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"{title}.")
 
         # 期刊名稱
-        journal = data.get('journal', '')
+        journal = get('journal', '')
+        volume = get('volume', '')  # 卷號
+        issue = get('issue', '')  # 期號
+        pages = get('pages', '')  # 頁碼
         if journal:
-            journal_part = f"*{journal}*"
+            journal_part = [f"*{journal}*"]
 
-            # 卷號
-            volume = data.get('volume', '')
             if volume:
-                journal_part += f", {volume}"
+                journal_part.append(f", {volume}")
 
-            # 期號
-            issue = data.get('issue', '')
             if issue:
-                journal_part += f"({issue})"
+                journal_part.append(f"({issue})")
 
-            # 頁碼
-            pages = data.get('pages', '')
             if pages:
-                journal_part += f", {pages}"
+                journal_part.append(f", {pages}")
 
-            parts.append(journal_part + ".")
+            journal_part.append(".")
+            parts.append("".join(journal_part))
 
         # DOI 或 URL
-        doi = data.get('doi', '')
+        doi = get('doi', '')
+        url = get('url', '')
         if doi:
             parts.append(f"https://doi.org/{doi}")
-        elif data.get('url'):
-            parts.append(data['url'])
+        elif url:
+            parts.append(url)
 
         return " ".join(parts)
 
@@ -177,28 +182,26 @@ class APAFormatter(BaseFormatter):
         格式化書籍
         格式：Author, A. A. (Year). Title of work. Publisher.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=True,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"({year}).")
 
         # 書名
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"*{title}*.")
 
         # 出版商
-        publisher = data.get('publisher', '')
+        publisher = get('publisher', '')
         if publisher:
             parts.append(f"{publisher}.")
 
@@ -209,33 +212,31 @@ class APAFormatter(BaseFormatter):
         格式化網站
         格式：Author, A. A. (Year, Month Day). Title of page. Site Name. URL
         """
+        get = data.get
         parts = []
 
         # 作者（如果有）
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=True,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"({year}).")
 
         # 標題
-        title = data.get('title', 'Untitled webpage')
+        title = get('title', 'Untitled webpage')
         parts.append(f"{title}.")
 
         # 網站名稱（如果有）
-        site_name = data.get('site_name', '')
+        site_name = get('site_name', '')
         if site_name:
             parts.append(f"*{site_name}*.")
 
         # URL
-        url = data.get('url', '')
+        url = get('url', '')
         if url:
             parts.append(url)
 
@@ -245,51 +246,52 @@ class APAFormatter(BaseFormatter):
 class MLAFormatter(BaseFormatter):
     """MLA 9th Edition 格式化器"""
 
+    __slots__ = ()
+
+    # 作者格式選項（傳給 _format_authors，各文獻類型共用；只有第一個作者倒置）
+    AUTHOR_OPTIONS = {'max_authors': 3, 'last_first': True, 'ampersand': False, 'invert_all': False}
+
     def format_article(self, data: Dict) -> str:
         """
         格式化期刊文章
         格式：Author Last, First. "Title of Article." Title of Journal, vol. #, no. #, Year, pp. #-#.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            max_authors=3,
-            last_first=True,
-            ampersand=False,
-            invert_all=False  # 只有第一個作者倒置
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 標題（使用引號）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f'"{title}."')
 
         # 期刊名稱（斜體）
-        journal = data.get('journal', '')
+        journal = get('journal', '')
+        volume = get('volume', '')  # 卷號
+        issue = get('issue', '')  # 期號
         if journal:
-            journal_part = f"*{journal}*"
+            journal_part = [f"*{journal}*"]
 
-            # 卷號
-            volume = data.get('volume', '')
             if volume:
-                journal_part += f", vol. {volume}"
+                journal_part.append(f", vol. {volume}")
 
-            # 期號
-            issue = data.get('issue', '')
             if issue:
-                journal_part += f", no. {issue}"
+                journal_part.append(f", no. {issue}")
 
-            parts.append(journal_part + ",")
+            journal_part.append(",")
+            parts.append("".join(journal_part))
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"{year},")
 
         # 頁碼
-        pages = data.get('pages', '')
+        pages = get('pages', '')
         if pages:
             parts.append(f"pp. {pages}.")
         else:
@@ -298,7 +300,7 @@ class MLAFormatter(BaseFormatter):
                 parts[-1] = parts[-1][:-1] + '.'
 
         # DOI
-        doi = data.get('doi', '')
+        doi = get('doi', '')
         if doi:
             parts.append(f"https://doi.org/{doi}")
 
@@ -309,30 +311,27 @@ class MLAFormatter(BaseFormatter):
         格式化書籍
         格式：Author Last, First. Title of Book. Publisher, Year.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            max_authors=3,
-            last_first=True,
-            ampersand=False,
-            invert_all=False
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 書名（斜體）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"*{title}*.")
 
         # 出版商
-        publisher = data.get('publisher', '')
+        publisher = get('publisher', '')
         if publisher:
             parts.append(f"{publisher},")
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"{year}.")
 
         return " ".join(parts)
@@ -342,35 +341,32 @@ class MLAFormatter(BaseFormatter):
         格式化網站
         格式：Author Last, First. "Title of Page." Website Name, Day Month Year, URL.
         """
+        get = data.get
         parts = []
 
         # 作者（如果有）
-        authors = self._format_authors(
-            data.get('authors', []),
-            max_authors=3,
-            last_first=True,
-            ampersand=False,
-            invert_all=False
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 標題
-        title = data.get('title', 'Untitled webpage')
+        title = get('title', 'Untitled webpage')
         parts.append(f'"{title}."')
 
         # 網站名稱
-        site_name = data.get('site_name', '')
+        site_name = get('site_name', '')
         if site_name:
             parts.append(f"*{site_name}*,")
 
         # 日期
-        year = data.get('year', '')
+        year = get('year', '')
         if year:
             parts.append(f"{year},")
 
         # URL
-        url = data.get('url', '')
+        url = get('url', '')
         if url:
             parts.append(f"{url}.")
 
@@ -380,59 +376,57 @@ class MLAFormatter(BaseFormatter):
 class ChicagoFormatter(BaseFormatter):
     """Chicago Manual of Style 17th Edition 格式化器（Notes and Bibliography）"""
 
+    __slots__ = ()
+
+    # 作者格式選項（傳給 _format_authors，各文獻類型共用；只有第一個作者倒置）
+    AUTHOR_OPTIONS = {'last_first': True, 'ampersand': False, 'invert_all': False}
+
     def format_article(self, data: Dict) -> str:
         """
         格式化期刊文章
         格式：Author Last, First. "Title of Article." Title of Journal volume, no. issue (Year): pages.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=False
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 標題（使用引號）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f'"{title}."')
 
         # 期刊名稱（斜體）
-        journal = data.get('journal', '')
+        journal = get('journal', '')
+        volume = get('volume', '')  # 卷號
+        issue = get('issue', '')  # 期號
         if journal:
-            journal_part = f"*{journal}*"
+            journal_part = [f"*{journal}*"]
 
-            # 卷號
-            volume = data.get('volume', '')
             if volume:
-                journal_part += f" {volume}"
+                journal_part.append(f" {volume}")
 
-            # 期號
-            issue = data.get('issue', '')
             if issue:
-                journal_part += f", no. {issue}"
+                journal_part.append(f", no. {issue}")
 
-            parts.append(journal_part)
+            parts.append("".join(journal_part))
 
         # 年份
-        year = data.get('year', 'n.d.')
-        year_part = f"({year})"
+        year = get('year', 'n.d.')
 
         # 頁碼
-        pages = data.get('pages', '')
+        pages = get('pages', '')
         if pages:
-            year_part += f": {pages}."
+            parts.append(f"({year}): {pages}.")
         else:
-            year_part += "."
-
-        parts.append(year_part)
+            parts.append(f"({year}).")
 
         # DOI
-        doi = data.get('doi', '')
+        doi = get('doi', '')
         if doi:
             parts.append(f"https://doi.org/{doi}")
 
@@ -443,25 +437,23 @@ class ChicagoFormatter(BaseFormatter):
         格式化書籍
         格式：Author Last, First. Title of Book. Place of Publication: Publisher, Year.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=False
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 書名（斜體）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"*{title}*.")
 
         # 出版地點（如果有）
-        place = data.get('place', '')
-        publisher = data.get('publisher', '')
+        place = get('place', '')
+        publisher = get('publisher', '')
 
         if place and publisher:
             pub_part = f"{place}: {publisher},"
@@ -474,7 +466,7 @@ class ChicagoFormatter(BaseFormatter):
             parts.append(pub_part)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"{year}.")
 
         return " ".join(parts)
@@ -484,34 +476,32 @@ class ChicagoFormatter(BaseFormatter):
         格式化網站
         格式：Author Last, First. "Title of Page." Website Name. Accessed Date. URL.
         """
+        get = data.get
         parts = []
 
         # 作者（如果有）
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=False
-        )
-        if authors:
-            parts.append(authors + ".")
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors + ".")
 
         # 標題
-        title = data.get('title', 'Untitled webpage')
+        title = get('title', 'Untitled webpage')
         parts.append(f'"{title}."')
 
         # 網站名稱
-        site_name = data.get('site_name', '')
+        site_name = get('site_name', '')
         if site_name:
             parts.append(f"*{site_name}*.")
 
         # 訪問日期（如果有）
-        access_date = data.get('access_date', '')
+        access_date = get('access_date', '')
         if access_date:
             parts.append(f"Accessed {access_date}.")
 
         # URL
-        url = data.get('url', '')
+        url = get('url', '')
         if url:
             parts.append(f"{url}.")
 
@@ -521,50 +511,52 @@ class ChicagoFormatter(BaseFormatter):
 class HarvardFormatter(BaseFormatter):
     """Harvard Referencing Style 格式化器"""
 
+    __slots__ = ()
+
+    # 作者格式選項（傳給 _format_authors，各文獻類型共用）
+    AUTHOR_OPTIONS = {'last_first': True, 'ampersand': False, 'invert_all': True}
+
     def format_article(self, data: Dict) -> str:
         """
         格式化期刊文章
         格式：Author, A.A. (Year) 'Title of article', Title of Journal, volume(issue), pp. pages.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"({year})")
 
         # 標題（使用單引號）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"'{title}',")
 
         # 期刊名稱（斜體）
-        journal = data.get('journal', '')
+        journal = get('journal', '')
+        volume = get('volume', '')  # 卷號
+        issue = get('issue', '')  # 期號
         if journal:
-            journal_part = f"*{journal}*"
+            journal_part = [f"*{journal}*"]
 
-            # 卷號
-            volume = data.get('volume', '')
             if volume:
-                journal_part += f", {volume}"
+                journal_part.append(f", {volume}")
 
-            # 期號
-            issue = data.get('issue', '')
             if issue:
-                journal_part += f"({issue})"
+                journal_part.append(f"({issue})")
 
-            parts.append(journal_part + ",")
+            journal_part.append(",")
+            parts.append("".join(journal_part))
 
         # 頁碼
-        pages = data.get('pages', '')
+        pages = get('pages', '')
         if pages:
             parts.append(f"pp. {pages}.")
         else:
@@ -573,7 +565,7 @@ class HarvardFormatter(BaseFormatter):
                 parts[-1] = parts[-1][:-1] + '.'
 
         # DOI
-        doi = data.get('doi', '')
+        doi = get('doi', '')
         if doi:
             parts.append(f"doi: {doi}")
 
@@ -584,29 +576,27 @@ class HarvardFormatter(BaseFormatter):
         格式化書籍
         格式：Author, A.A. (Year) Title of Book. Place: Publisher.
         """
+        get = data.get
         parts = []
 
         # 作者
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', 'n.d.')
+        year = get('year', 'n.d.')
         parts.append(f"({year})")
 
         # 書名（斜體）
-        title = data.get('title', 'Untitled')
+        title = get('title', 'Untitled')
         parts.append(f"*{title}*.")
 
         # 出版地點和出版商
-        place = data.get('place', '')
-        publisher = data.get('publisher', '')
+        place = get('place', '')
+        publisher = get('publisher', '')
 
         if place and publisher:
             parts.append(f"{place}: {publisher}.")
@@ -620,39 +610,37 @@ class HarvardFormatter(BaseFormatter):
         格式化網站
         格式：Author, A.A. (Year) 'Title of page', Website Name. Available at: URL (Accessed: date).
         """
+        get = data.get
         parts = []
 
         # 作者（如果有）
-        authors = self._format_authors(
-            data.get('authors', []),
-            last_first=True,
-            ampersand=False,
-            invert_all=True
-        )
-        if authors:
-            parts.append(authors)
+        authors_raw = get('authors')
+        if authors_raw:
+            authors = self._format_authors(authors_raw, **self.AUTHOR_OPTIONS)
+            if authors:
+                parts.append(authors)
 
         # 年份
-        year = data.get('year', '')
+        year = get('year', '')
         if year:
             parts.append(f"({year})")
 
         # 標題
-        title = data.get('title', 'Untitled webpage')
+        title = get('title', 'Untitled webpage')
         parts.append(f"'{title}',")
 
         # 網站名稱
-        site_name = data.get('site_name', '')
+        site_name = get('site_name', '')
         if site_name:
             parts.append(f"*{site_name}*.")
 
         # URL
-        url = data.get('url', '')
+        url = get('url', '')
         if url:
             parts.append(f"Available at: {url}")
 
         # 訪問日期（如果有）
-        access_date = data.get('access_date', '')
+        access_date = get('access_date', '')
         if access_date:
             parts.append(f"(Accessed: {access_date}).")
 
@@ -662,12 +650,13 @@ class HarvardFormatter(BaseFormatter):
 class ReferenceFormatter:
     """文獻格式化器管理類"""
 
-    FORMATTERS = {
+    # 唯讀的格式註冊表
+    FORMATTERS = MappingProxyType({
         'apa': APAFormatter(),
         'mla': MLAFormatter(),
         'chicago': ChicagoFormatter(),
         'harvard': HarvardFormatter(),
-    }
+    })
 
     @classmethod
     def format(cls, data: Dict, style: str = 'apa') -> str:
@@ -706,4 +695,12 @@ class ReferenceFormatter:
         Returns:
             格式化後的文獻字串列表
         """
-        return [cls.format(ref, style) for ref in references]
+        # 格式器只在迴圈外解析一次
+        style = style.lower()
+        formatter = cls.FORMATTERS.get(style)
+
+        if not formatter:
+            raise ValueError(f"不支援的格式: {style}")
+
+        fmt = formatter.format
+        return [fmt(ref) for ref in references]
@@ -9,87 +9,191 @@ Reference Parser Module
 - 評估資料完整度
 """
 
+import logging
+import os
 import re
-from typing import Dict, Optional, List
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterator, Optional, List
+
+
+# 正則引擎：設定 PARSER_REGEX_ENGINE=re2 且已安裝 google-re2 時使用 RE2（線性時間、無回溯），
+# 否則使用標準 re 模組。RE2 可避免異常輸入造成的災難性回溯，但對一般的短文獻行，
+# Python 綁定的呼叫成本使其比 re 慢；另外 RE2 的 \b、\d、\s 只處理 ASCII
+re2 = None
+if os.environ.get('PARSER_REGEX_ENGINE', 're').lower() == 're2':
+    try:
+        import re2
+    except ImportError:
+        logging.getLogger(__name__).warning("未安裝 google-re2，改用標準 re 模組")
+
+
+def _compile(pattern: str, ignorecase: bool = False):
+    """以選定的正則引擎編譯表達式"""
+    if re2 is not None:
+        return re2.compile(('(?i)' if ignorecase else '') + pattern)
+    return re.compile(pattern, re.IGNORECASE if ignorecase else 0)
+
+
+_DOI_PATTERN = r'10\.\d{4,9}/[-._;()/:A-Za-z0-9]+'
+_YEAR_PATTERN = r'\b(19\d{2}|20\d{2})\b'
+_VOL_ISSUE_PATTERN = r'(\d+)\((\d+)\),?\s*(\d+(?:-\d+)?)'
+
+# 預先編譯的正則表達式（避免每次呼叫時查詢 re 模組的快取）
+_DOI_RE = _compile(_DOI_PATTERN, ignorecase=True)
+_DOI_STRIP_RE = _compile(_DOI_PATTERN)
+_DOI_PREFIX_RE = _compile(r'doi:|DOI:|https://doi\.org/')
+_YEAR_RE = _compile(_YEAR_PATTERN)
+_YEAR_PAREN_RE = _compile(r'\((' + _YEAR_PATTERN + r')\)')
+_APA_AUTHOR_RE = _compile(r'([A-Z][a-z]+(?:-[A-Z][a-z]+)?),\s*([A-Z]\.(?:\s*[A-Z]\.)?)')
+_SIMPLE_AUTHOR_RE = _compile(r'\b([A-Z][a-z]+)\s+([A-Z][a-z]+)\b')
+_TITLE_AFTER_YEAR_RE = _compile(r'\(?\d{4}\)?\.\s*(.+?)\.')
+_TRAILING_JOURNAL_RE = _compile(r'\s*[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*,?\s*$')
+_VOL_ISSUE_RE = _compile(_VOL_ISSUE_PATTERN)
+_VOL_PAGES_RE = _compile(r'(\d+),\s*(\d+(?:-\d+)?)')
+_URL_RE = _compile(r'https?://\S+')
+
+# 各文獻類型的必要欄位（計算完整度用）
+_REQUIRED_FIELDS = {
+    'article': ('authors', 'year', 'title', 'journal'),
+    'book': ('authors', 'year', 'title', 'publisher'),
+    'website': ('title', 'url'),
+    'unknown': ('authors', 'year', 'title'),
+}
+
+# 完整度：欄位存在與否的位元組合 -> 完整度，每種文獻類型一張表
+# bit 0 = authors, 1 = year, 2 = title, 3 = journal, 4 = publisher, 5 = url
+_COMPLETENESS_FIELDS = ('authors', 'year', 'title', 'journal', 'publisher', 'url')
+_COMPLETENESS_TABLE = {
+    ref_type: tuple(
+        sum(1 for name in fields if flags >> _COMPLETENESS_FIELDS.index(name) & 1) / len(fields)
+        for flags in range(1 << len(_COMPLETENESS_FIELDS))
+    )
+    for ref_type, fields in _REQUIRED_FIELDS.items()
+}
+
+# 信心度：bit 0 = doi (+0.4), 1 = authors (+0.2), 2 = year (+0.1), 3 = title (+0.1),
+# 4 = journal 或 volume (+0.2)；依原本的相加順序預先計算，結果與逐項累加完全相同
+_CONFIDENCE_WEIGHTS = (0.4, 0.2, 0.1, 0.1, 0.2)
+
+
+def _confidence_score(flags: int) -> float:
+    confidence = 0.0
+    for bit, weight in enumerate(_CONFIDENCE_WEIGHTS):
+        if flags >> bit & 1:
+            confidence += weight
+    return min(confidence, 1.0)
+
+
+_CONFIDENCE_TABLE = tuple(_confidence_score(flags) for flags in range(1 << len(_CONFIDENCE_WEIGHTS)))
+
+
+@dataclass(slots=True)
+class ParsedReference:
+    """
+    解析後的文獻資料
+
+    使用 __slots__ 減少大量文獻時的記憶體用量；只在 JSON 回應時轉為字典
+    （Flask 的 JSON provider 可直接序列化 dataclass）
+    """
+
+    original_text: str = ''
+    authors: List[Dict[str, str]] = field(default_factory=list)
+    year: Optional[str] = None
+    title: Optional[str] = None
+    journal: Optional[str] = None
+    volume: Optional[str] = None
+    issue: Optional[str] = None
+    pages: Optional[str] = None
+    doi: Optional[str] = None
+    url: Optional[str] = None
+    publisher: Optional[str] = None
+    type: str = 'unknown'  # article, book, website, unknown
+    completeness: float = 0.0  # 0.0 到 1.0
+    confidence: float = 0.0  # 解析信心度
+    enriched: Optional[bool] = None  # 是否已透過 API 補完
+    enrichment_source: Optional[str] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """與 dict.get 相同的讀取介面，讓格式化器可同時處理字典與 ParsedReference"""
+        return getattr(self, key, default)
+
+    def copy(self) -> 'ParsedReference':
+        """淺複製"""
+        return replace(self)
 
 
 class ReferenceParser:
     """文獻解析器"""
 
     # DOI 正則表達式
-    DOI_PATTERN = r'10\.\d{4,9}/[-._;()/:A-Za-z0-9]+'
+    DOI_PATTERN = _DOI_PATTERN
 
     # 年份正則表達式（1900-2099）
-    YEAR_PATTERN = r'\b(19\d{2}|20\d{2})\b'
+    YEAR_PATTERN = _YEAR_PATTERN
 
     # 作者模式（Last, F. M. 或 First Last）
     AUTHOR_PATTERN = r'([A-Z][a-z]+(?:-[A-Z][a-z]+)?(?:,\s*[A-Z]\.(?:\s*[A-Z]\.)?)?)'
 
     # 期刊卷期頁碼模式
-    VOLUME_ISSUE_PATTERN = r'(\d+)\((\d+)\),?\s*(\d+(?:-\d+)?)'
+    VOLUME_ISSUE_PATTERN = _VOL_ISSUE_PATTERN
 
-    def parse_reference(self, text: str) -> Dict:
+    # 各文獻類型的必要欄位（計算完整度用）
+    REQUIRED_FIELDS = _REQUIRED_FIELDS
+
+    def parse_reference(self, text: str, fast_mode: bool = False) -> ParsedReference:
         """
         解析純文字文獻
 
         Args:
             text: 原始文獻文字
+            fast_mode: 找到 DOI 時只回傳 DOI，略過其餘欄位的提取（之後可透過 CrossRef 補完）
 
         Returns:
-            結構化的文獻資料字典
+            結構化的文獻資料
         """
-        result = {
-            'original_text': text,
-            'authors': [],
-            'year': None,
-            'title': None,
-            'journal': None,
-            'volume': None,
-            'issue': None,
-            'pages': None,
-            'doi': None,
-            'url': None,
-            'publisher': None,
-            'type': 'unknown',  # article, book, website, unknown
-            'completeness': 0.0,  # 0.0 到 1.0
-            'confidence': 0.0,  # 解析信心度
-        }
+        result = ParsedReference(original_text=text)
 
         # 1. 提取 DOI（優先）
-        result['doi'] = self.extract_doi(text)
+        result.doi = self.extract_doi(text)
+        if fast_mode and result.doi:
+            result.type = 'article'
+            result.confidence = self.calculate_confidence(result)
+            return result
 
         # 2. 提取年份
-        result['year'] = self.extract_year(text)
+        result.year = self.extract_year(text)
 
         # 3. 提取作者
-        result['authors'] = self.extract_authors(text)
+        result.authors = self.extract_authors(text)
 
         # 4. 提取標題（粗略估計）
-        result['title'] = self.extract_title(text)
+        result.title = self.extract_title(text)
 
         # 5. 提取期刊資訊
         journal_info = self.extract_journal_info(text)
         if journal_info:
-            result.update(journal_info)
+            for key, value in journal_info.items():
+                setattr(result, key, value)
 
         # 6. 提取 URL
-        result['url'] = self.extract_url(text)
+        result.url = self.extract_url(text)
 
         # 7. 判斷文獻類型
-        result['type'] = self.detect_reference_type(result)
+        result.type = self.detect_reference_type(result)
 
         # 8. 計算完整度和信心度
-        result['completeness'] = self.calculate_completeness(result)
-        result['confidence'] = self.calculate_confidence(result)
+        result.completeness = self.calculate_completeness(result)
+        result.confidence = self.calculate_confidence(result)
 
         return result
 
     def extract_doi(self, text: str) -> Optional[str]:
         """提取 DOI"""
         # 移除常見的 DOI 前綴
-        text = text.replace('doi:', '').replace('DOI:', '').replace('https://doi.org/', '')
+        text = _DOI_PREFIX_RE.sub('', text)
 
-        match = re.search(self.DOI_PATTERN, text, re.IGNORECASE)
+        # DOI 必以「10.」開頭，沒有時不必執行正則
+        match = _DOI_RE.search(text) if '10.' in text else None
         if match:
             doi = match.group(0)
             # 清理尾部標點符號
@@ -100,12 +204,12 @@ class ReferenceParser:
     def extract_year(self, text: str) -> Optional[str]:
         """提取年份"""
         # 通常年份在括號中：(2020) 或在作者後：Smith 2020
-        year_match = re.search(r'\((' + self.YEAR_PATTERN + r')\)', text)
+        year_match = _YEAR_PAREN_RE.search(text)
         if year_match:
             return year_match.group(1)
 
         # 如果沒找到括號中的年份，找任何年份
-        year_match = re.search(self.YEAR_PATTERN, text)
+        year_match = _YEAR_RE.search(text)
         if year_match:
             return year_match.group(0)
 
@@ -120,9 +224,8 @@ class ReferenceParser:
         """
         authors = []
 
-        # 嘗試匹配 APA 格式：Last, F. M.
-        apa_pattern = r'([A-Z][a-z]+(?:-[A-Z][a-z]+)?),\s*([A-Z]\.(?:\s*[A-Z]\.)?)'
-        matches = re.findall(apa_pattern, text)
+        # 嘗試匹配 APA 格式：Last, F. M.（必定含逗號與句點，沒有時不必執行正則）
+        matches = _APA_AUTHOR_RE.findall(text) if ',' in text and '.' in text else ()
 
         for match in matches:
             authors.append({
@@ -132,8 +235,7 @@ class ReferenceParser:
 
         # 如果沒找到，嘗試匹配簡單格式：FirstName LastName
         if not authors:
-            simple_pattern = r'\b([A-Z][a-z]+)\s+([A-Z][a-z]+)\b'
-            matches = re.findall(simple_pattern, text[:100])  # 只搜尋前 100 字元
+            matches = _SIMPLE_AUTHOR_RE.findall(text[:100])  # 只搜尋前 100 字元
 
             for match in matches[:3]:  # 最多取 3 個
                 authors.append({
@@ -151,16 +253,17 @@ class ReferenceParser:
         1. 如果有句號，假設第一個句號後、第二個句號前是標題
         2. 移除年份和作者後的文字可能是標題
         """
-        # 移除 DOI 和 URL
-        clean_text = re.sub(r'https?://\S+', '', text)
-        clean_text = re.sub(self.DOI_PATTERN, '', clean_text)
+        # 移除 DOI 和 URL（先以子字串檢查略過不可能匹配的掃描）
+        clean_text = _URL_RE.sub('', text) if '://' in text else text
+        if '10.' in clean_text:
+            clean_text = _DOI_STRIP_RE.sub('', clean_text)
 
         # 嘗試找到年份後的第一個句點之前的文字
-        year_match = re.search(r'\(?\d{4}\)?\.\s*(.+?)\.', clean_text)
+        year_match = _TITLE_AFTER_YEAR_RE.search(clean_text)
         if year_match:
             title = year_match.group(1).strip()
             # 移除期刊名稱（通常是斜體或大寫）
-            title = re.sub(r'\s*[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*,?\s*$', '', title)
+            title = _TRAILING_JOURNAL_RE.sub('', title)
             return title
 
         # 如果找不到，返回 None
@@ -169,7 +272,8 @@ class ReferenceParser:
     def extract_journal_info(self, text: str) -> Optional[Dict]:
         """提取期刊、卷、期、頁碼資訊"""
         # 匹配格式：Volume(Issue), Pages 或 Volume, Pages
-        match = re.search(self.VOLUME_ISSUE_PATTERN, text)
+        # 前者必須有括號、後者必須有逗號，沒有時不必執行對應的正則
+        match = _VOL_ISSUE_RE.search(text) if '(' in text else None
 
         if match:
             return {
@@ -179,7 +283,7 @@ class ReferenceParser:
             }
 
         # 嘗試只匹配卷號和頁碼
-        simple_match = re.search(r'(\d+),\s*(\d+(?:-\d+)?)', text)
+        simple_match = _VOL_PAGES_RE.search(text) if ',' in text else None
         if simple_match:
             return {
                 'volume': simple_match.group(1),
@@ -190,8 +294,7 @@ class ReferenceParser:
 
     def extract_url(self, text: str) -> Optional[str]:
         """提取 URL"""
-        url_pattern = r'https?://[^\s]+'
-        match = re.search(url_pattern, text)
+        match = _URL_RE.search(text) if '://' in text else None
         if match:
             url = match.group(0)
             # 清理尾部標點符號
@@ -199,7 +302,7 @@ class ReferenceParser:
             return url
         return None
 
-    def detect_reference_type(self, data: Dict) -> str:
+    def detect_reference_type(self, data: ParsedReference) -> str:
         """
         根據欄位判斷文獻類型
 
@@ -207,48 +310,39 @@ class ReferenceParser:
             'article', 'book', 'website', 'unknown'
         """
         # 有期刊、卷、期 -> 期刊文章
-        if data.get('journal') or (data.get('volume') and data.get('issue')):
+        if data.journal or (data.volume and data.issue):
             return 'article'
 
         # 有出版商但無期刊 -> 書籍
-        if data.get('publisher') and not data.get('journal'):
+        if data.publisher and not data.journal:
             return 'book'
 
         # 有 URL 但無 DOI 和期刊 -> 網站
-        if data.get('url') and not data.get('doi') and not data.get('journal'):
+        if data.url and not data.doi and not data.journal:
             return 'website'
 
         # 有 DOI -> 很可能是期刊文章
-        if data.get('doi'):
+        if data.doi:
             return 'article'
 
         return 'unknown'
 
-    def calculate_completeness(self, data: Dict) -> float:
+    def calculate_completeness(self, data: ParsedReference) -> float:
         """
         計算資料完整度
 
         根據文獻類型，檢查必要欄位是否存在
         """
-        required_fields = {
-            'article': ['authors', 'year', 'title', 'journal'],
-            'book': ['authors', 'year', 'title', 'publisher'],
-            'website': ['title', 'url'],
-            'unknown': ['authors', 'year', 'title']
-        }
-
-        ref_type = data.get('type', 'unknown')
-        fields = required_fields.get(ref_type, required_fields['unknown'])
-
-        present = 0
-        for field in fields:
-            value = data.get(field)
-            if value and (not isinstance(value, list) or len(value) > 0):
-                present += 1
-
-        return present / len(fields) if fields else 0.0
-
-    def calculate_confidence(self, data: Dict) -> float:
+        flags = (bool(data.authors)
+                 | bool(data.year) << 1
+                 | bool(data.title) << 2
+                 | bool(data.journal) << 3
+                 | bool(data.publisher) << 4
+                 | bool(data.url) << 5)
+        table = _COMPLETENESS_TABLE.get(data.type, _COMPLETENESS_TABLE['unknown'])
+        return table[flags]
+
+    def calculate_confidence(self, data: ParsedReference) -> float:
         """
         計算解析信心度
 
@@ -257,48 +351,58 @@ class ReferenceParser:
         - 是否有明確的結構化資訊
         - 欄位的數量和品質
         """
-        confidence = 0.0
-
-        # DOI 存在：+0.4
-        if data.get('doi'):
-            confidence += 0.4
-
-        # 作者存在且格式良好：+0.2
-        if data.get('authors') and len(data['authors']) > 0:
-            confidence += 0.2
-
-        # 年份存在：+0.1
-        if data.get('year'):
-            confidence += 0.1
-
-        # 標題存在：+0.1
-        if data.get('title'):
-            confidence += 0.1
-
-        # 期刊資訊存在：+0.2
-        if data.get('journal') or data.get('volume'):
-            confidence += 0.2
-
-        return min(confidence, 1.0)
-
-    def parse_multiple(self, text: str, separator: str = '\n') -> List[Dict]:
+        flags = (bool(data.doi)
+                 | bool(data.authors) << 1
+                 | bool(data.year) << 2
+                 | bool(data.title) << 3
+                 | bool(data.journal or data.volume) << 4)
+        return _CONFIDENCE_TABLE[flags]
+
+    def parse_multiple(self, text: str, separator: str = '\n',
+                       fast_mode: bool = False) -> List[ParsedReference]:
         """
         解析多條文獻
 
         Args:
             text: 包含多條文獻的文字
             separator: 分隔符（預設為換行）
+            fast_mode: 同 parse_reference
 
         Returns:
             文獻列表
         """
-        lines = text.split(separator)
-        references = []
+        lines = [line for line in map(str.strip, text.split(separator)) if line]  # 忽略空行
 
-        for line in lines:
-            line = line.strip()
-            if line:  # 忽略空行
-                ref = self.parse_reference(line)
-                references.append(ref)
+        parse = self.parse_reference
+        return [parse(line, fast_mode) for line in lines]
+
+    def iter_parse_multiple(self, text: str, separator: str = '\n',
+                            fast_mode: bool = False) -> Iterator[ParsedReference]:
+        """
+        逐條解析多條文獻（生成器）
+
+        不建立整份行列表與結果列表，處理大型文獻清單時記憶體用量維持固定
 
-        return references
+        Args:
+            text: 包含多條文獻的文字
+            separator: 分隔符（預設為換行）
+            fast_mode: 同 parse_reference
+
+        Yields:
+            解析後的文獻資料
+        """
+        if not separator:
+            raise ValueError("empty separator")
+
+        parse = self.parse_reference
+        find = text.find
+        step = len(separator)
+        start = 0
+        while True:
+            end = find(separator, start)
+            line = (text[start:] if end < 0 else text[start:end]).strip()
+            if line:  # 忽略空行
+                yield parse(line, fast_mode)
+            if end < 0:
+                return
+            start = end + step
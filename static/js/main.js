@@ -66,6 +66,9 @@ parseBtn.addEventListener('click', async () => {
     resultsContainer.classList.add('hidden');
     parseBtn.disabled = true;
 
+    // 記錄請求時的格式：解析期間使用者可能切換格式
+    const requestedFormat = currentFormat;
+
     try {
         const response = await fetch('/parse', {
             method: 'POST',
@@ -74,7 +77,7 @@ parseBtn.addEventListener('click', async () => {
             },
             body: JSON.stringify({
                 text: text,
-                format: currentFormat,
+                format: requestedFormat,
                 enrich: true
             })
         });
@@ -83,9 +86,18 @@ parseBtn.addEventListener('click', async () => {
 
         if (data.success) {
             processedReferences = data.references;
+            // 後端只返回請求的格式，記錄下來供之後切換格式時使用
+            processedReferences.forEach(ref => {
+                ref.formatted_all = ref.formatted_all || { [requestedFormat]: ref.formatted };
+            });
             displayResults(data.references);
             resultCount.textContent = data.count;
             resultsContainer.classList.remove('hidden');
+
+            // 解析期間已切換格式時，改為顯示目前選擇的格式
+            if (currentFormat !== requestedFormat) {
+                updateReferencesFormat(currentFormat);
+            }
         } else {
             alert('處理失敗：' + data.error);
         }
@@ -216,13 +228,48 @@ function escapeHtml(text) {
 }
 
 // 更新文獻格式顯示
-function updateReferencesFormat(format) {
-    // 更新每個文獻的格式化顯示
-    processedReferences.forEach((ref, index) => {
-        // 使用已經在後端生成的所有格式版本
-        if (ref.formatted_all && ref.formatted_all[format]) {
-            ref.formatted = ref.formatted_all[format];
+async function updateReferencesFormat(format) {
+    // 尚未取得該格式的文獻，向後端請求重新格式化
+    const missing = processedReferences.filter(ref => !(ref.formatted_all && ref.formatted_all[format]));
+
+    if (missing.length > 0) {
+        try {
+            const response = await fetch('/reformat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    references: missing.map(ref => ref.data),
+                    format: format
+                })
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                missing.forEach((ref, index) => {
+                    ref.formatted_all = ref.formatted_all || {};
+                    ref.formatted_all[format] = data.formatted[index];
+                });
+            } else {
+                alert('格式切換失敗：' + data.error);
+                return;
+            }
+        } catch (error) {
+            alert('發生錯誤：' + error.message);
+            return;
         }
+    }
+
+    // 格式切換期間使用者可能已選擇其他格式
+    if (format !== currentFormat) {
+        return;
+    }
+
+    // 更新每個文獻的格式化顯示
+    processedReferences.forEach(ref => {
+        ref.formatted = ref.formatted_all[format];
     });
 
     // 重新顯示結果